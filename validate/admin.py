@@ -1,3 +1,219 @@
+import json
+import uuid
+
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from .models import Error, Message, MessageXML
+
+KEYSET_VAR = "after"
+# Ниже этого порога оценке планировщика не доверяем и считаем точно
+ESTIMATE_THRESHOLD = 10000
+ERROR_CODES = [
+    "E000", "E001", "E002", "E003", "E004", "E005", "E006", "E007", "E008", "E009",
+    "E010", "E011", "E012", "E013", "E014", "E015", "E016", "E017", "E018", "E019", "E020", "E999",
+]
+
+
+class EstimatedCountPaginator(Paginator):
+    """Берёт число строк из EXPLAIN вместо COUNT(*) по большой таблице."""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            # queryset.none(), например поиск не по UUID: SQL не строится, строк нет
+            return 0
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = int(plan[0]["Plan"]["Plan Rows"])
+        if estimate < ESTIMATE_THRESHOLD:
+            return super().count
+        return estimate
+
+
+class KeysetChangeList(ChangeList):
+    """Список по убыванию keyset_fields админки: следующая страница — строки «меньше» последней, без OFFSET.
+
+    Курсор в ?after= — значения ключа последней строки через «|».
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.keyset_after = request.GET.get(KEYSET_VAR)
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(KEYSET_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Смена фильтра или поиска начинает список с первой страницы
+        new_params = new_params or {}
+        remove = list(remove or [])
+        if KEYSET_VAR not in new_params:
+            remove.append(KEYSET_VAR)
+        return super().get_query_string(new_params, remove)
+
+    def keyset_filter(self, fields, cursor):
+        values = cursor.split("|")
+        if len(values) != len(fields):
+            raise ValueError("Invalid keyset cursor")
+        opts = self.model._meta
+        values = [
+            (opts.pk if name == "pk" else opts.get_field(name)).to_python(value)
+            for name, value in zip(fields, values)
+        ]
+        # (a, b) < (x, y)  ⇔  a < x  или  a = x и b < y; a <= x даёт планировщику диапазон по индексу
+        condition = Q()
+        for i, name in enumerate(fields):
+            condition |= Q(**dict(zip(fields[:i], values[:i])), **{f"{name}__lt": values[i]})
+        return Q(**{f"{fields[0]}__lte": values[0]}) & condition
+
+    def keyset_cursor(self, obj):
+        values = []
+        for name in self.model_admin.keyset_fields:
+            value = getattr(obj, name)
+            values.append(value.isoformat() if hasattr(value, "isoformat") else str(value))
+        return "|".join(values)
+
+    def get_results(self, request):
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        fields = self.model_admin.keyset_fields
+        queryset = self.queryset.order_by(*[f"-{name}" for name in fields])
+        try:
+            if self.keyset_after:
+                queryset = queryset.filter(self.keyset_filter(fields, self.keyset_after))
+            rows = list(queryset[:self.list_per_page + 1])
+        except (ValueError, ValidationError):
+            raise IncorrectLookupParameters
+
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = rows[:self.list_per_page]
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = paginator
+        self.first_page_query = self.get_query_string()
+        self.next_page_query = None
+        if len(rows) > self.list_per_page:
+            self.next_page_query = self.get_query_string({KEYSET_VAR: self.keyset_cursor(self.result_list[-1])})
+
+
+class ErrorCodeFilter(admin.SimpleListFilter):
+    # Фиксированный список вместо SELECT DISTINCT error_code по всей таблице
+    title = "error code"
+    parameter_name = "error_code"
+
+    def lookups(self, request, model_admin):
+        return [(code, code) for code in ERROR_CODES]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(error_code=self.value())
+        return queryset
+
+
+class HighVolumeAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ("-pk",)
+    keyset_fields = ("pk",)
+    sortable_by = ()
+    list_per_page = 50
+    search_help_text = "Exact message UUID"
+    message_lookup = "message_id"
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        # Только точный поиск по UUID, чтобы запрос шёл по индексу
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        try:
+            return queryset.filter(**{self.message_lookup: uuid.UUID(search_term)}), False
+        except ValueError:
+            return queryset.none(), False
+
+
+@admin.register(Message)
+class MessageAdmin(HighVolumeAdmin):
+    list_display = ("id", "message_version", "timestamp", "created_at")
+    list_select_related = ("message_version",)
+    list_filter = ("message_version", "created_at")
+    search_fields = ("id",)
+    message_lookup = "id"
+    # UUID4 случаен, поэтому новые сообщения сверху — по (created_at, id) и индексу message_created_at_id_idx
+    ordering = ("-created_at", "-id")
+    keyset_fields = ("created_at", "id")
+    readonly_fields = ("id", "created_at")
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).only(
+            "id", "timestamp", "created_at", "signature", "message_version__version_code"
+        )
+
+
+@admin.register(Error)
+class ErrorAdmin(HighVolumeAdmin):
+    list_display = ("id", "message_id", "error_code", "error_message")
+    list_filter = (ErrorCodeFilter, "message__message_version", "message__created_at")
+    search_fields = ("message_id",)
+    raw_id_fields = ("message",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).only("id", "message_id", "error_code", "error_message")
+
+
+@admin.register(MessageXML)
+class MessageXMLAdmin(HighVolumeAdmin):
+    list_display = ("id", "message_id", "xml_url_link")
+    list_filter = ("message__message_version", "message__created_at")
+    search_fields = ("message_id",)
+    fields = ("message", "xml_url_link", "raw_xml")
+    readonly_fields = ("message", "xml_url_link", "raw_xml")
+
+    def get_queryset(self, request):
+        # xml_content подгружается только по ссылке raw_xml
+        return super().get_queryset(request).only("id", "message_id", "xml_url_link")
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:object_id>/raw/",
+                self.admin_site.admin_view(self.raw_xml_view),
+                name="validate_messagexml_raw",
+            ),
+        ] + super().get_urls()
+
+    @admin.display(description="Raw XML")
+    def raw_xml(self, obj):
+        return format_html('<a href="{}">Open</a>', reverse("admin:validate_messagexml_raw", args=[obj.pk]))
 
-# Register your models here.
+    def raw_xml_view(self, request, object_id):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        xml_content = get_object_or_404(MessageXML.objects.only("xml_content"), pk=object_id).xml_content
+        # Документ прислан отправителем: как XML с origin админки он мог бы выполнить скрипт
+        response = HttpResponse(xml_content, content_type="text/plain; charset=utf-8")
+        response["X-Content-Type-Options"] = "nosniff"
+        return response
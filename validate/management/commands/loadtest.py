@@ -0,0 +1,327 @@
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytz
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from kombu import Connection
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from validate.work_with_xml.v1.worklxml import get_storage
+from valxml.Celery import app
+from watch.checker_path import BROKER_URL, TASK_NAME, TaskSender, WatcherHandler, make_queue, task_queue
+
+DOCUMENT_TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
+<ExportData>
+  <DocumentID>{document_id}</DocumentID>
+  <TimeStamp>{timestamp}</TimeStamp>
+  <Version>{version}</Version>
+  <SignedData><Signature>BASE64_ENCODED_SIGNATURE</Signature></SignedData>
+  <Sender><SenderName>Load Test</SenderName><SenderINN>000000000000</SenderINN></Sender>
+  <Members><Member><MemberName>Member {n}</MemberName></Member></Members>
+  <Operation>
+    <TransactionDate>2025-01-01</TransactionDate>
+    <Amount>{amount}</Amount>
+    <Currency>KGS</Currency>
+    <OperationType>transfer</OperationType>
+  </Operation>
+</ExportData>
+"""
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def wait_for_worker(worker, hostname, timeout):
+    """Ждёт ответа воркера на ping: до этого он ещё не слушает свою очередь."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if worker is not None and worker.poll() is not None:
+            raise CommandError(f"Worker {hostname} exited with code {worker.returncode}")
+        if app.control.ping(destination=[hostname], timeout=1.0):
+            return
+    raise CommandError(f"Worker {hostname} did not answer ping within {timeout}s")
+
+
+class NotificationTracker(FileSystemEventHandler):
+    """Фиксирует момент, когда уведомление <DocumentID>.<Status>Notification.xml сохранено в MinIO.
+
+    Событие о локальном файле в out/ приходит до его записи и выгрузки, поэтому оно лишь ставит
+    документ в ожидание, а время завершения берётся по появлению объекта notifications/<имя> в хранилище.
+    """
+
+    def __init__(self, poll_interval=0.1, workers=8):
+        super().__init__()
+        self.completed = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.poll_interval = poll_interval
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="loadtest-poll")
+        self.stopped = threading.Event()
+        self.poller = threading.Thread(target=self.poll, daemon=True)
+
+    def on_created(self, event):
+        if event.is_directory or not event.src_path.endswith("Notification.xml"):
+            return
+        file_name = os.path.basename(event.src_path)
+        document_id = file_name.split(".")[0]
+        with self.lock:
+            if document_id not in self.completed:
+                self.pending[document_id] = f"notifications/{file_name}"
+
+    def check(self, document_id, key):
+        if get_storage().exists(key):
+            with self.lock:
+                self.completed.setdefault(document_id, time.time())
+                self.pending.pop(document_id, None)
+
+    def poll(self):
+        while not self.stopped.is_set():
+            with self.lock:
+                pending = list(self.pending.items())
+            list(self.pool.map(lambda item: self.check(*item), pending))
+            self.stopped.wait(self.poll_interval)
+
+    def start(self):
+        self.poller.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.poller.join()
+        self.pool.shutdown()
+
+
+class QueueSampler(threading.Thread):
+    def __init__(self, interval, queue):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.queue = queue
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        with Connection(BROKER_URL) as connection:
+            channel = connection.default_channel
+            while not self.stopped.is_set():
+                try:
+                    # У Redis пустая очередь не существует как ключ, поэтому passive-проверка не подходит
+                    depth = channel.queue_declare(queue=self.queue.name).message_count
+                except Exception:
+                    depth = None
+                self.samples.append((time.time(), depth))
+                self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Command(BaseCommand):
+    help = (
+        "Flood the watched inbox (or the broker) with generated documents and measure throughput, "
+        "end-to-end latency, queue depth and the saturation point. Creates real Message rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=["inbox", "broker"], default="inbox",
+                            help="inbox: write files and run WatcherHandler; broker: send tasks directly")
+        parser.add_argument("--rates", default="10",
+                            help="Comma-separated arrival rates (docs/s), one step per rate")
+        parser.add_argument("--step-duration", type=float, default=30.0)
+        parser.add_argument("--burst-size", type=int, default=0, help="Extra documents sent at once every burst interval")
+        parser.add_argument("--burst-interval", type=float, default=10.0)
+        parser.add_argument("--drain", type=float, default=60.0, help="Seconds to wait for outstanding notifications")
+        parser.add_argument("--concurrency", type=int, default=None,
+                            help="Start a dedicated Celery worker with this concurrency on its own queue; "
+                                 "otherwise use the running workers on the default queue")
+        parser.add_argument("--worker-timeout", type=float, default=60.0,
+                            help="Seconds to wait for the dedicated worker to answer ping")
+        parser.add_argument("--inbox", default="/app/in",
+                            help="Watched directory; stop the watchdog service or use another path to avoid double submission")
+        parser.add_argument("--staging", default=os.path.join(settings.BASE_DIR, "loadtest_in"),
+                            help="Unwatched directory where broker mode writes files before sending tasks")
+        parser.add_argument("--version-code", default="1.0")
+        parser.add_argument("--sample-interval", type=float, default=1.0)
+        parser.add_argument("--report", default=None, help="Write the full report as JSON")
+
+    def handle(self, *args, **options):
+        try:
+            rates = [float(rate) for rate in options["rates"].split(",")]
+        except ValueError:
+            raise CommandError("--rates must be a comma-separated list of numbers")
+
+        out_dir = os.path.join(settings.BASE_DIR, "out")
+        target_dir = options["inbox"] if options["mode"] == "inbox" else options["staging"]
+        os.makedirs(out_dir, exist_ok=True)
+        os.makedirs(target_dir, exist_ok=True)
+
+        worker = None
+        queue = task_queue
+        if options["concurrency"]:
+            # Отдельная очередь: задачи не уходят воркерам сервиса celery, и насыщение относится к этому --concurrency
+            queue = make_queue(f"loadtest-{os.getpid()}")
+            worker = subprocess.Popen([
+                "celery", "-A", "valxml", "worker", "--loglevel=warning", f"-Q{queue.name}",
+                f"--concurrency={options['concurrency']}", f"--hostname={queue.name}@%h",
+            ])
+            try:
+                # %h Celery раскрывает в socket.gethostname()
+                wait_for_worker(worker, f"{queue.name}@{socket.gethostname()}", options["worker_timeout"])
+            except CommandError:
+                worker.terminate()
+                worker.wait()
+                raise
+
+        options["queue"] = queue.name
+        sender = TaskSender(broker_url=BROKER_URL, queue=queue)
+        tracker = NotificationTracker()
+        tracker.start()
+        observers = []
+        out_observer = Observer()
+        out_observer.schedule(tracker, path=out_dir, recursive=False)
+        out_observer.start()
+        observers.append(out_observer)
+        if options["mode"] == "inbox":
+            inbox_observer = Observer()
+            inbox_observer.schedule(WatcherHandler(sender), path=target_dir, recursive=False)
+            inbox_observer.start()
+            observers.append(inbox_observer)
+
+        sampler = QueueSampler(options["sample_interval"], queue)
+        sampler.start()
+
+        sent = {}
+        steps = []
+        try:
+            for rate in rates:
+                self.stdout.write(f"Step: {rate} docs/s for {options['step_duration']}s")
+                step = {"rate": rate, "started": time.time(), "documents": []}
+                self.run_step(step, rate, target_dir, sender, sent, options)
+                step["finished"] = time.time()
+                steps.append(step)
+
+            deadline = time.time() + options["drain"]
+            while time.time() < deadline:
+                with tracker.lock:
+                    if len(tracker.completed.keys() & sent.keys()) == len(sent):
+                        break
+                time.sleep(0.5)
+        finally:
+            sampler.stop()
+            for observer in observers:
+                observer.stop()
+                observer.join()
+            tracker.stop()
+            sender.close()
+            if worker:
+                worker.terminate()
+                worker.wait()
+
+        report = self.build_report(steps, sent, tracker.completed, sampler.samples, options)
+        self.print_report(report)
+        if options["report"]:
+            with open(options["report"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def run_step(self, step, rate, target_dir, sender, sent, options):
+        interval = 1.0 / rate if rate > 0 else None
+        started = time.monotonic()
+        next_send = started
+        next_burst = started + options["burst_interval"]
+        while time.monotonic() - started < options["step_duration"]:
+            now = time.monotonic()
+            batch = 0
+            if interval and now >= next_send:
+                batch = 1
+                next_send += interval
+            if options["burst_size"] and now >= next_burst:
+                batch += options["burst_size"]
+                next_burst += options["burst_interval"]
+            for _ in range(batch):
+                document_id = self.send_document(target_dir, sender, options, len(sent))
+                sent[document_id] = time.time()
+                step["documents"].append(document_id)
+            if not batch:
+                time.sleep(0.001)
+
+    def send_document(self, target_dir, sender, options, n):
+        document_id = str(uuid.uuid4())
+        content = DOCUMENT_TEMPLATE.format(
+            document_id=document_id,
+            timestamp=datetime.now(pytz.UTC).strftime("%Y-%m-%dT%H:%M:%S"),
+            version=options["version_code"],
+            n=n,
+            amount=f"{100 + n % 1000}.50",
+        )
+        file_path = os.path.join(target_dir, f"{document_id}.xml")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        if options["mode"] == "broker":
+            sender.send(TASK_NAME, [file_path])
+        return document_id
+
+    def build_report(self, steps, sent, completed, samples, options):
+        report = {"mode": options["mode"], "concurrency": options["concurrency"], "queue": options["queue"],
+                  "steps": [], "saturation": None}
+        for step in steps:
+            latencies = [completed[d] - sent[d] for d in step["documents"] if d in completed]
+            # Пропускная способность — все уведомления, сохранённые за время шага, включая документы прошлых шагов
+            in_window = [completed[d] for d in sent if d in completed and step["started"] <= completed[d] <= step["finished"]]
+            duration = step["finished"] - step["started"]
+            depths = [depth for t, depth in samples if step["started"] <= t <= step["finished"] and depth is not None]
+            result = {
+                "rate": step["rate"],
+                "sent": len(step["documents"]),
+                "completed": len(latencies),
+                "throughput": round(len(in_window) / duration, 2) if duration else 0,
+                "latency_p50": percentile(latencies, 50),
+                "latency_p95": percentile(latencies, 95),
+                "latency_p99": percentile(latencies, 99),
+                "latency_max": max(latencies) if latencies else None,
+                "queue_depth_start": depths[0] if depths else None,
+                "queue_depth_end": depths[-1] if depths else None,
+                "queue_depth_max": max(depths) if depths else None,
+            }
+            offered = result["sent"] / duration if duration else 0
+            # Насыщение: система не успевает за входящим потоком, и очередь растёт
+            growing = bool(depths) and depths[-1] - depths[0] > max(1, offered * duration * 0.1)
+            result["saturated"] = result["throughput"] < 0.9 * offered or growing
+            if result["saturated"] and report["saturation"] is None:
+                report["saturation"] = {"rate": step["rate"], "max_throughput": max(
+                    [s["throughput"] for s in report["steps"]] + [result["throughput"]]
+                )}
+            report["steps"].append(result)
+        report["queue_depth"] = [[round(t, 3), depth] for t, depth in samples]
+        return report
+
+    def print_report(self, report):
+        def fmt(value):
+            return "-" if value is None else f"{value:.3f}" if isinstance(value, float) else str(value)
+
+        self.stdout.write(f"{'rate':>8} {'sent':>7} {'done':>7} {'thrpt/s':>8} {'p50':>8} {'p95':>8} "
+                          f"{'p99':>8} {'max':>8} {'qmax':>6} {'sat':>4}")
+        for step in report["steps"]:
+            self.stdout.write(
+                f"{fmt(step['rate']):>8} {step['sent']:>7} {step['completed']:>7} {fmt(step['throughput']):>8} "
+                f"{fmt(step['latency_p50']):>8} {fmt(step['latency_p95']):>8} {fmt(step['latency_p99']):>8} "
+                f"{fmt(step['latency_max']):>8} {fmt(step['queue_depth_max']):>6} {'yes' if step['saturated'] else 'no':>4}"
+            )
+        if report["saturation"]:
+            self.stdout.write(self.style.WARNING(
+                f"Saturated at {report['saturation']['rate']} docs/s "
+                f"(max sustained throughput {report['saturation']['max_throughput']} docs/s)"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS("No saturation reached at the tested rates"))
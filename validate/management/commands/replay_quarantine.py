@@ -0,0 +1,41 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from validate.tasks import process_xml_file
+
+
+class Command(BaseCommand):
+    help = "Re-feed quarantined XML files to Celery at a controlled rate"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rate", type=float, default=5.0, help="Files per second")
+        parser.add_argument("--limit", type=int, default=None, help="Maximum number of files to replay")
+
+    def handle(self, *args, **options):
+        quarantine_dir = settings.QUARANTINE_DIR
+        if not os.path.isdir(quarantine_dir):
+            self.stdout.write(f"Quarantine directory {quarantine_dir} does not exist")
+            return
+
+        # Сначала самые старые файлы
+        files = sorted(
+            (os.path.join(quarantine_dir, name) for name in os.listdir(quarantine_dir) if name.endswith(".xml")),
+            key=os.path.getmtime,
+        )
+        if options["limit"] is not None:
+            files = files[:options["limit"]]
+
+        interval = 1.0 / options["rate"] if options["rate"] > 0 else 0
+        next_send = time.monotonic()
+        for file_path in files:
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            process_xml_file.delay(file_path)
+            next_send += interval
+            self.stdout.write(f"Task sent to Celery for processing: {file_path}")
+
+        self.stdout.write(self.style.SUCCESS(f"Replayed {len(files)} quarantined files"))
@@ -0,0 +1,79 @@
+import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from validate.revalidate import init_worker, next_chunk_ids, revalidate_chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Revalidate stored MessageXML documents against the current rules and report status changes. "
+        "Documents without a stored status are counted as unknown and skipped; migration 0006 backfills "
+        "the status of documents stored before MessageXML.status existed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--checkpoint", default="revalidate.checkpoint.json")
+        parser.add_argument("--report", default="revalidate.report.jsonl")
+        parser.add_argument("--resume", action="store_true", help="Continue from the checkpoint file")
+
+    def handle(self, *args, **options):
+        checkpoint_path = options["checkpoint"]
+        state = {"last_id": 0, "processed": 0, "changed": 0, "unknown": 0}
+        if options["resume"] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                state.update(json.load(f))
+            self.stdout.write(f"Resuming after MessageXML id {state['last_id']}")
+
+        max_in_flight = options["workers"] * 2
+        report_mode = "a" if options["resume"] else "w"
+
+        with open(options["report"], report_mode) as report, \
+                ProcessPoolExecutor(
+                    max_workers=options["workers"],
+                    # При fork дети наследуют открытое соединение родителя и закрывают его сессию
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_worker,
+                ) as pool:
+            pending = deque()
+            last_id = state["last_id"]
+            exhausted = False
+            while pending or not exhausted:
+                while not exhausted and len(pending) < max_in_flight:
+                    ids = next_chunk_ids(last_id, options["chunk_size"])
+                    if not ids:
+                        exhausted = True
+                        break
+                    last_id = ids[-1]
+                    pending.append(pool.submit(revalidate_chunk, ids))
+                if not pending:
+                    break
+
+                # Результаты забираем по порядку, чтобы checkpoint не перепрыгнул незавершённый чанк
+                result = pending.popleft().result()
+                for change in result["changes"]:
+                    report.write(json.dumps(change, ensure_ascii=False) + "\n")
+                report.flush()
+
+                state["last_id"] = result["last_id"]
+                state["processed"] += result["processed"]
+                state["changed"] += len(result["changes"])
+                state["unknown"] += result["unknown"]
+                with open(checkpoint_path + ".tmp", "w") as f:
+                    json.dump(state, f)
+                os.replace(checkpoint_path + ".tmp", checkpoint_path)
+                self.stdout.write(
+                    f"Processed {state['processed']} documents, {state['changed']} status changes, "
+                    f"{state['unknown']} without stored status (last id {state['last_id']})"
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Revalidation finished: {state['processed']} documents, {state['changed']} status changes, "
+            f"{state['unknown']} without stored status"
+        ))
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('validate', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SenderKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inn', models.CharField(max_length=12, unique=True)),
+                ('public_key', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'sender_key',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся CONCURRENTLY, чтобы не блокировать запись в большие таблицы.
+    # (created_at, id) обслуживает keyset-пагинацию сообщений в админке
+    atomic = False
+
+    dependencies = [
+        ('validate', '0002_senderkey'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='message',
+            index=models.Index(fields=['created_at', 'id'], name='message_created_at_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='error',
+            index=models.Index(fields=['error_code', '-id'], name='error_code_id_idx'),
+        ),
+    ]
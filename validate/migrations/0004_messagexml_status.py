@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('validate', '0003_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagexml',
+            name='status',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Подпись RSA-2048 в base64 — 344 символа, RSA-4096 — 684
+
+    dependencies = [
+        ('validate', '0004_messagexml_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='signature',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+
+# Ошибки записи в БД и MinIO и непредвиденные сбои не относятся к итогу проверки документа
+PERSISTENCE_ERROR_CODES = ["E010", "E011", "E012", "E013", "E014", "E016", "E999"]
+BATCH_SIZE = 10000
+
+
+def backfill_status(apps, schema_editor):
+    # Статус строк, сохранённых до 0004, восстанавливается по ошибкам проверки их сообщения
+    MessageXML = apps.get_model('validate', 'MessageXML')
+    Error = apps.get_model('validate', 'Error')
+    validation_errors = Error.objects.filter(message_id=OuterRef('message_id')).exclude(
+        error_code__in=PERSISTENCE_ERROR_CODES
+    )
+    last_id = 0
+    while True:
+        ids = list(
+            MessageXML.objects.filter(id__gt=last_id, status='')
+            .order_by('id')
+            .values_list('id', flat=True)[:BATCH_SIZE]
+        )
+        if not ids:
+            break
+        batch = MessageXML.objects.filter(id__in=ids)
+        batch.filter(Exists(validation_errors)).update(status='failed')
+        batch.filter(status='').update(status='success')
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+    # Каждая пачка коммитится отдельно, чтобы не держать блокировки на всей таблице
+    atomic = False
+
+    dependencies = [
+        ('validate', '0005_alter_message_signature'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_status, migrations.RunPython.noop),
+    ]
@@ -24,10 +24,11 @@ class Message(models.Model):
     message_version = models.ForeignKey(MessageVersion, on_delete=models.CASCADE, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     timestamp = models.DateTimeField(null=True, blank=True)  # Разрешаем NULL
-    signature = models.CharField(max_length=255, blank=True, default="")
+    signature = models.TextField(blank=True, default="")
 
     class Meta:
         db_table = 'message'
+        indexes = [models.Index(fields=['created_at', 'id'], name='message_created_at_id_idx')]
 
 class Operation(models.Model):
     message = models.ForeignKey(Message, on_delete=models.CASCADE)
@@ -57,6 +58,7 @@ class MessageXML(models.Model):
     message = models.ForeignKey(Message, on_delete=models.CASCADE)
     xml_content = models.TextField()
     xml_url_link = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, blank=True, default="")
 
     class Meta:
         db_table = 'message_xml'
@@ -68,6 +70,7 @@ class Error(models.Model):
 
     class Meta:
         db_table = 'error'
+        indexes = [models.Index(fields=['error_code', '-id'], name='error_code_id_idx')]
 
 class Rule(models.Model):
     document_field = models.ForeignKey(DocumentFields, on_delete=models.CASCADE)
@@ -94,4 +97,12 @@ class Requirement(models.Model):
     error_template = models.CharField(max_length=255)
 
     class Meta:
-        db_table = 'requirement'
\ No newline at end of file
+        db_table = 'requirement'
+
+class SenderKey(models.Model):
+    inn = models.CharField(max_length=12, unique=True)
+    public_key = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'sender_key'
@@ -0,0 +1,66 @@
+# Модуль импортируется в процессах пула до django.setup(), поэтому модели и валидатор подключаются внутри функций
+from lxml import etree
+
+# Кэш версий и правил живёт в каждом процессе пула до конца прогона
+_rules_cache = {}
+
+
+def init_worker():
+    # Процессы пула запускаются через spawn: своё соединение с БД, без сокета родителя
+    import django
+    django.setup()
+    _rules_cache.clear()
+
+
+def next_chunk_ids(last_id, chunk_size):
+    from validate.models import MessageXML
+    return list(
+        MessageXML.objects.filter(id__gt=last_id)
+        .order_by("id")
+        .values_list("id", flat=True)[:chunk_size]
+    )
+
+
+def revalidate_chunk(ids):
+    from validate.models import MessageXML
+    from .work_with_xml.v1.signature import verify_batch
+    from .work_with_xml.v1.worklxml import revalidate_xml
+
+    documents = list(
+        MessageXML.objects.filter(id__in=ids)
+        .order_by("id")
+        .values_list("id", "message_id", "xml_content", "status")
+    )
+
+    # Строки без статуса сравнить не с чем: их не разбираем и не проверяем
+    comparable = [document for document in documents if document[3]]
+    unknown = len(documents) - len(comparable)
+
+    results = {}
+    parsed = []
+    for xml_id, _, xml_content, _ in comparable:
+        try:
+            parsed.append((xml_id, etree.fromstring(xml_content.encode("utf-8"))))
+        except etree.LxmlError as e:
+            results[xml_id] = {"status": "failed", "errors": [{"error_code": "E009", "error_message": f"XML parsing error: {str(e)}"}]}
+
+    # Подписи чанка проверяются пакетом, сгруппированным по отправителю
+    signature_errors = verify_batch([root for _, root in parsed])
+    for (xml_id, root), sig_errors in zip(parsed, signature_errors):
+        result = revalidate_xml(root, _rules_cache)
+        if sig_errors:
+            result = {"status": "failed", "errors": result["errors"] + sig_errors}
+        results[xml_id] = result
+
+    changes = []
+    for xml_id, message_id, _, old_status in comparable:
+        result = results[xml_id]
+        if result["status"] != old_status:
+            changes.append({
+                "message_xml_id": xml_id,
+                "message_id": str(message_id),
+                "old_status": old_status,
+                "new_status": result["status"],
+                "errors": result["errors"],
+            })
+    return {"last_id": ids[-1], "processed": len(documents), "unknown": unknown, "changes": changes}
@@ -1,12 +1,50 @@
 from celery import shared_task
-from .work_with_xml.v1.worklxml import validate_xml
+from django.conf import settings
+from .work_with_xml.v1.worklxml import validate_xml, TransientError
 import os
-@shared_task(ignore_result=True)
-def process_xml_file(file_path):
-    result = validate_xml(file_path)
+import random
+import shutil
+
+
+def retry_countdown(retries):
+    # Экспоненциальная задержка с полным jitter, чтобы повторы не шли одной волной
+    return random.uniform(0, min(settings.XML_RETRY_BACKOFF_MAX, settings.XML_RETRY_BACKOFF * 2 ** retries))
+
+
+def quarantine_file(file_path):
+    quarantine_dir = os.path.abspath(settings.QUARANTINE_DIR)
+    if os.path.dirname(os.path.abspath(file_path)) == quarantine_dir:
+        return file_path
+    os.makedirs(quarantine_dir, exist_ok=True)
+    target = os.path.join(quarantine_dir, os.path.basename(file_path))
+    if os.path.exists(target):
+        target = os.path.join(quarantine_dir, f"{os.urandom(4).hex()}_{os.path.basename(file_path)}")
+    shutil.move(file_path, target)
+    return target
+
+
+@shared_task(bind=True, ignore_result=True, max_retries=settings.XML_RETRY_MAX_RETRIES)
+def process_xml_file(self, file_path):
+    try:
+        result = validate_xml(file_path)
+    except TransientError as e:
+        if self.request.retries < self.max_retries:
+            countdown = retry_countdown(self.request.retries)
+            print(f"[DEBUG] Временный сбой, повтор {self.request.retries + 1} через {countdown:.1f} с: {e}")
+            raise self.retry(exc=e, countdown=countdown)
+        quarantine_path = quarantine_file(file_path)
+        dead_letter_xml_file.delay(quarantine_path, str(e))
+        print(f"[DEBUG] Повторы исчерпаны, файл перемещён в карантин: {quarantine_path}")
+        return
     if result["status"] == "failed":
         print(f"[DEBUG] Валидация не пройдена: {result['errors']}")
     else:
         print(f"[DEBUG] Валидация успешна: {result['file']}")
     os.remove(file_path)
-    print(f"[DEBUG] Файл {file_path} удалён")
\ No newline at end of file
+    print(f"[DEBUG] Файл {file_path} удалён")
+
+
+@shared_task(ignore_result=True)
+def dead_letter_xml_file(file_path, error):
+    # Очередь dead_letter по умолчанию никто не читает: сообщения копятся до разбора или replay_quarantine
+    print(f"[DEBUG] Dead letter: {file_path}: {error}")
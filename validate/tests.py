@@ -1,3 +1,318 @@
-from django.test import TestCase
+import base64
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+from botocore.exceptions import EndpointConnectionError, ReadTimeoutError
+from celery.contrib.testing.worker import start_worker
+from celery.signals import task_postrun
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import pkcs1_15
+from django.db import OperationalError
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+from lxml import etree
+
+from valxml.Celery import app
+from watch.checker_path import TASK_NAME, TaskSender, make_queue
+
+from . import revalidate, tasks
+from .management.commands import loadtest
+from .models import Error, Members, Message, MessageVersion, MessageXML, Operation, SenderKey
+from .work_with_xml.v1 import signature, worklxml
+
+DOCUMENT = """<ExportData>
+  <DocumentID>2f1c6a8e-3b7d-4e2a-9c1f-5d8e7b6a4c3d</DocumentID>
+  <TimeStamp>2025-01-01T10:00:00</TimeStamp>
+  <Version>1.0</Version>
+  <SignedData><Signature>{signature}</Signature></SignedData>
+  <Sender><SenderName>Test</SenderName>{inn}</Sender>
+  <Operation><Amount>100.50</Amount><Currency>KGS</Currency></Operation>
+</ExportData>"""
+
+
+def complete_document(document):
+    # Добавляет Members и поля Operation, без которых validate_xml не сохраняет сообщение
+    return (document
+            .replace("<Amount>", "<TransactionDate>2025-01-01</TransactionDate><OperationType>t</OperationType><Amount>")
+            .replace("</Sender>", "</Sender><Members><Member><MemberName>M</MemberName></Member></Members>"))
+
+
+def use_memory_broker(test_case):
+    # Настройки Celery заданы с пространством имён CELERY_, поэтому подменяем ключ целиком
+    previous = {key: app.conf[key] for key in ("CELERY_BROKER_URL", "CELERY_RESULT_BACKEND")}
+    app.conf.update(CELERY_BROKER_URL="memory://", CELERY_RESULT_BACKEND="cache+memory://")
+    test_case.addCleanup(app.conf.update, previous)
+
+
+def patch_storage(test_case, base_dir):
+    storage = mock.Mock()
+    storage.url.return_value = "http://minio/original.xml"
+    for target, value in [("BASE_DIR", base_dir), ("ensure_bucket_exists", mock.Mock()),
+                          ("get_storage", mock.Mock(return_value=storage))]:
+        patcher = mock.patch.object(worklxml, target, value)
+        patcher.start()
+        test_case.addCleanup(patcher.stop)
+    return storage
+
+
+@override_settings(SIGNATURE_VERIFICATION=True, SIGNATURE_KEY_CACHE_TTL=300)
+class SignatureVerificationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key = RSA.generate(2048)
+
+    def setUp(self):
+        signature._key_cache.clear()
+        SenderKey.objects.create(inn="123456789012", public_key=self.private_key.publickey().export_key().decode())
+
+    def signed_document(self, inn="<SenderINN>123456789012</SenderINN>", amount="100.50", template=DOCUMENT, wrap=None):
+        unsigned = etree.fromstring(template.format(signature="", inn=inn))
+        digest = SHA256.new(signature.signed_payload(unsigned))
+        value = base64.b64encode(pkcs1_15.new(self.private_key).sign(digest)).decode()
+        if wrap:
+            value = "\n" + "\n".join(value[i:i + wrap] for i in range(0, len(value), wrap)) + "\n"
+        return template.format(signature=value, inn=inn).replace("100.50", amount)
+
+    def test_valid_signature(self):
+        root = etree.fromstring(self.signed_document())
+        self.assertEqual(signature.submit_verification(root).result(), [])
+
+    def test_tampered_document(self):
+        root = etree.fromstring(self.signed_document(amount="999.00"))
+        errors = signature.submit_verification(root).result()
+        self.assertEqual([e["error_code"] for e in errors], ["E018"])
+
+    def test_unknown_sender_key(self):
+        root = etree.fromstring(self.signed_document(inn="<SenderINN>000000000000</SenderINN>"))
+        errors = signature.submit_verification(root).result()
+        self.assertEqual([e["error_code"] for e in errors], ["E019"])
+
+    def test_missing_sender_inn(self):
+        root = etree.fromstring(self.signed_document(inn=""))
+        errors = signature.submit_verification(root).result()
+        self.assertEqual([e["error_code"] for e in errors], ["E020"])
+
+    def test_batch_matches_single_verification(self):
+        roots = [
+            etree.fromstring(self.signed_document()),
+            etree.fromstring(self.signed_document(amount="999.00")),
+            etree.fromstring(self.signed_document(inn="<SenderINN>000000000000</SenderINN>")),
+            etree.fromstring(self.signed_document(inn="")),
+        ]
+        codes = [[e["error_code"] for e in errors] for errors in signature.verify_batch(roots)]
+        self.assertEqual(codes, [[], ["E018"], ["E019"], ["E020"]])
+
+    def test_line_wrapped_signature(self):
+        root = etree.fromstring(self.signed_document(wrap=76))
+        self.assertEqual(signature.submit_verification(root).result(), [])
+
+    def test_validate_xml_stores_signed_message(self):
+        MessageVersion.objects.create(version_code="1.0", xml_schema="")
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patch_storage(self, tmp.name)
+        file_path = os.path.join(tmp.name, "doc.xml")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(self.signed_document(template=complete_document(DOCUMENT)))
+
+        result = worklxml.validate_xml(file_path)
+        self.assertEqual(result["status"], "success", result)
+        # Подпись RSA-2048 в base64 длиннее 255 символов и хранится целиком
+        message = Message.objects.get()
+        self.assertEqual(len(message.signature), 344)
+        self.assertFalse(Error.objects.exists())
+
+    def test_payload_keeps_text_after_signed_data(self):
+        root = etree.fromstring(DOCUMENT.format(signature="x", inn=""))
+        # Удаляется только элемент, перевод строки после него остаётся
+        expected = etree.fromstring(DOCUMENT.format(signature="", inn="").replace("<SignedData><Signature></Signature></SignedData>", ""))
+        self.assertEqual(signature.signed_payload(root), etree.tostring(expected, method="c14n"))
+
+
+class TransientFailureTests(TestCase):
+    def setUp(self):
+        MessageVersion.objects.create(version_code="1.0", xml_schema="")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.file_path = os.path.join(self.tmp.name, "doc.xml")
+        with open(self.file_path, "w", encoding="utf-8") as f:
+            f.write(complete_document(DOCUMENT.format(signature="c2lnbmF0dXJl", inn="<SenderINN>123456789012</SenderINN>")))
+        self.storage = patch_storage(self, self.tmp.name)
+
+    def row_counts(self):
+        return [model.objects.count() for model in (Message, Operation, Members, MessageXML, Error)]
+
+    def test_notification_upload_failure_rolls_back_and_retry_writes_once(self):
+        self.storage.save.side_effect = [None, EndpointConnectionError(endpoint_url="http://minio"), None, None]
+        with self.assertRaises(worklxml.TransientError):
+            worklxml.validate_xml(self.file_path)
+        self.assertEqual(self.row_counts(), [0, 0, 0, 0, 0])
+        self.assertTrue(os.path.exists(self.file_path))
+
+        result = worklxml.validate_xml(self.file_path)
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(self.row_counts(), [1, 1, 1, 1, 0])
+
+    def test_storage_read_timeout_is_transient(self):
+        self.storage.save.side_effect = ReadTimeoutError(endpoint_url="http://minio")
+        with self.assertRaises(worklxml.TransientError):
+            worklxml.validate_xml(self.file_path)
+        self.assertEqual(self.row_counts(), [0, 0, 0, 0, 0])
+        self.assertTrue(os.path.exists(self.file_path))
+
+    def test_database_failure_on_child_row_is_transient(self):
+        with mock.patch.object(Operation.objects, "create", side_effect=OperationalError("connection lost")):
+            with self.assertRaises(worklxml.TransientError):
+                worklxml.validate_xml(self.file_path)
+        self.assertEqual(self.row_counts(), [0, 0, 0, 0, 0])
+
+
+class TaskSenderTests(SimpleTestCase):
+    """Сообщение вотчера должно приниматься воркером valxml как обычная задача Celery."""
+
+    def setUp(self):
+        self.queue = make_queue("watcher-test")
+        use_memory_broker(self)
+        self.sender = TaskSender(broker_url="memory://", queue=self.queue)
+        self.addCleanup(self.sender.close)
+
+    def test_worker_runs_task_sent_by_watcher(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        file_path = os.path.join(tmp.name, "doc.xml")
+        open(file_path, "w").close()
+        done = threading.Event()
+        validate_xml = mock.Mock(return_value={"status": "success", "file": file_path})
+        with mock.patch.object(tasks, "validate_xml", validate_xml), \
+                start_worker(app, pool="solo", queues=[self.queue.name], perform_ping_check=False):
+            task_postrun.connect(lambda **kwargs: done.set(), sender=tasks.process_xml_file,
+                                 weak=False, dispatch_uid="watcher-test")
+            self.addCleanup(task_postrun.disconnect, dispatch_uid="watcher-test")
+            self.sender.send(TASK_NAME, [file_path])
+            self.assertTrue(done.wait(10))
+        validate_xml.assert_called_once_with(file_path)
+        self.assertFalse(os.path.exists(file_path))
+
+
+class AdminSearchTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+
+    def test_non_uuid_search_shows_empty_list(self):
+        # Поиск не по UUID даёт queryset.none(), для которого EXPLAIN не строится
+        for url in ("/admin/validate/message/?q=not-a-uuid", "/admin/validate/error/?q=xyz",
+                    "/admin/validate/messagexml/?q=xyz"):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(response.context["cl"].result_count, 0, url)
+
+
+class StoredStatusTests(TestCase):
+    def setUp(self):
+        MessageVersion.objects.create(version_code="1.0", xml_schema="")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.file_path = os.path.join(self.tmp.name, "doc.xml")
+        self.xml_content = complete_document(DOCUMENT.format(signature="c2lnbmF0dXJl", inn="<SenderINN>123456789012</SenderINN>"))
+        with open(self.file_path, "w", encoding="utf-8") as f:
+            f.write(self.xml_content)
+        patch_storage(self, self.tmp.name)
+
+    def test_persistence_error_does_not_change_stored_status(self):
+        with mock.patch.object(Operation.objects, "create", side_effect=ValueError("bad date")):
+            result = worklxml.validate_xml(self.file_path)
+        self.assertEqual([e["error_code"] for e in result["errors"]], ["E012"])
+        # Документ прошёл проверку: повторная проверка не должна считать это изменением failed→success
+        xml = MessageXML.objects.get()
+        self.assertEqual(xml.status, "success")
+        self.assertEqual(revalidate.revalidate_chunk([xml.id])["changes"], [])
+
+    def test_rows_without_status_are_not_revalidated(self):
+        message = Message.objects.create()
+        xml = MessageXML.objects.create(message=message, xml_content=self.xml_content, xml_url_link="u")
+        with mock.patch.object(revalidate.etree, "fromstring") as fromstring:
+            result = revalidate.revalidate_chunk([xml.id])
+        fromstring.assert_not_called()
+        self.assertEqual((result["processed"], result["unknown"], result["changes"]), (1, 1, []))
+
+    def test_backfill_status_from_validation_errors(self):
+        migration = importlib.import_module("validate.migrations.0006_backfill_messagexml_status")
+        statuses = {}
+        for name, codes in [("clean", []), ("invalid", ["E006"]), ("not_saved", ["E012"]), ("done", None)]:
+            message = Message.objects.create()
+            for code in codes or []:
+                Error.objects.create(message=message, error_code=code, error_message="")
+            statuses[name] = MessageXML.objects.create(message=message, xml_content="", xml_url_link="u",
+                                                       status="failed" if codes is None else "")
+        migration.backfill_status(apps, None)
+        self.assertEqual(
+            {name: MessageXML.objects.get(pk=xml.pk).status for name, xml in statuses.items()},
+            {"clean": "success", "invalid": "failed", "not_saved": "success", "done": "failed"},
+        )
+
+
+class LoadTestCommandTests(SimpleTestCase):
+    """Прогон loadtest через memory:// и воркер Celery в этом же процессе."""
+
+    def setUp(self):
+        use_memory_broker(self)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.out_dir = os.path.join(self.tmp.name, "out")
+        settings_patch = override_settings(BASE_DIR=self.tmp.name)
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        storage = mock.Mock()
+        storage.exists.return_value = True
+        for target, name, value in [(loadtest, "BROKER_URL", "memory://"),
+                                    (loadtest, "get_storage", mock.Mock(return_value=storage)),
+                                    (tasks, "validate_xml", self.validate_xml)]:
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def validate_xml(self, file_path):
+        # Вместо проверки и записи в БД — только уведомление в out/, как его пишет create_notification_file
+        document_id = os.path.basename(file_path).split(".")[0]
+        notification = os.path.join(self.out_dir, f"{document_id}.AcceptingNotification.xml")
+        with open(notification, "w") as f:
+            f.write("<Notification/>")
+        return {"status": "success", "file": notification}
+
+    def run_loadtest(self, mode):
+        report = os.path.join(self.tmp.name, "report.json")
+        with start_worker(app, pool="solo", queues=["celery"], perform_ping_check=False):
+            call_command(
+                "loadtest", mode=mode, rates="20", step_duration=0.5, drain=10, sample_interval=0.1,
+                inbox=os.path.join(self.tmp.name, "in"), staging=os.path.join(self.tmp.name, "in"),
+                report=report, stdout=io.StringIO(),
+            )
+        with open(report) as f:
+            return json.load(f)
+
+    def test_broker_mode(self):
+        step = self.run_loadtest("broker")["steps"][0]
+        self.assertGreater(step["sent"], 0)
+        self.assertEqual(step["completed"], step["sent"])
+
+    def test_inbox_mode(self):
+        step = self.run_loadtest("inbox")["steps"][0]
+        self.assertGreater(step["sent"], 0)
+        self.assertEqual(step["completed"], step["sent"])
+
+    def test_wait_for_worker(self):
+        hostname = "loadtest-test@localhost"
+        with start_worker(app, pool="solo", hostname=hostname, perform_ping_check=False):
+            loadtest.wait_for_worker(None, hostname, timeout=10)
+        with self.assertRaises(CommandError):
+            loadtest.wait_for_worker(None, "missing@localhost", timeout=1)
@@ -0,0 +1,134 @@
+import base64
+import copy
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import pkcs1_15
+from lxml import etree
+from django.conf import settings
+from validate.models import SenderKey
+
+# Кэш публичных ключей отправителей: inn -> (ключ или None, момент истечения)
+_key_cache = {}
+_key_cache_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.SIGNATURE_WORKERS, thread_name_prefix="signature")
+        return _executor
+
+
+def get_public_key(inn):
+    now = time.monotonic()
+    with _key_cache_lock:
+        cached = _key_cache.get(inn)
+        if cached and cached[1] > now:
+            return cached[0]
+
+    key = None
+    try:
+        key = RSA.import_key(SenderKey.objects.get(inn=inn).public_key)
+    except SenderKey.DoesNotExist:
+        pass
+    except (ValueError, IndexError, TypeError) as e:
+        print(f"Некорректный публичный ключ отправителя {inn}: {e}")
+
+    # Отсутствие ключа тоже кэшируем, чтобы не ходить в БД на каждый документ
+    with _key_cache_lock:
+        _key_cache[inn] = (key, now + settings.SIGNATURE_KEY_CACHE_TTL)
+    return key
+
+
+def signed_payload(root):
+    """Байты, которые подписывает отправитель.
+
+    Схема: RSA PKCS#1 v1.5 над SHA-256 от канонической формы (C14N 1.0, без комментариев)
+    корневого элемента, из которого удалены дочерние элементы SignedData верхнего уровня.
+    Удаляется только сам элемент: текст после него (tail) остаётся на месте, как при
+    enveloped-signature преобразовании XMLDSig. Подпись передаётся в SignedData/Signature в base64.
+    """
+    document = copy.deepcopy(root)
+    for signed_data in document.findall("SignedData"):
+        # lxml remove() уносит tail вместе с элементом, переносим его на соседа
+        if signed_data.tail:
+            previous = signed_data.getprevious()
+            if previous is not None:
+                previous.tail = (previous.tail or "") + signed_data.tail
+            else:
+                document.text = (document.text or "") + signed_data.tail
+        document.remove(signed_data)
+    return etree.tostring(document, method="c14n")
+
+
+def verify(key, payload, signature):
+    # base64 в XML часто переносят по строкам; validate=True отвергает пробельные символы
+    signature = "".join(signature.split())
+    try:
+        pkcs1_15.new(key).verify(SHA256.new(payload), base64.b64decode(signature, validate=True))
+        return []
+    except (ValueError, TypeError):
+        return [{"error_code": "E018", "error_message": "Invalid signature in SignedData"}]
+
+
+def _missing_key_errors(inn):
+    if not inn:
+        return [{"error_code": "E020", "error_message": "Missing SenderINN, signature cannot be verified"}]
+    return [{"error_code": "E019", "error_message": f"No public key for sender: {inn}"}]
+
+
+def _done(errors):
+    future = Future()
+    future.set_result(errors)
+    return future
+
+
+def submit_verification(root):
+    """Ставит проверку подписи в пул потоков и возвращает Future со списком ошибок.
+
+    Ключ и каноническая форма готовятся в вызывающем потоке, в пул уходит только криптография,
+    поэтому проверка идёт параллельно с записью в БД и MinIO.
+    """
+    if not settings.SIGNATURE_VERIFICATION:
+        return _done([])
+
+    signature = root.findtext("SignedData/Signature")
+    if not signature:
+        # Отсутствие подписи уже даёт E005
+        return _done([])
+
+    inn = root.findtext(".//Sender/SenderINN")
+    key = get_public_key(inn) if inn else None
+    if key is None:
+        return _done(_missing_key_errors(inn))
+
+    return get_executor().submit(verify, key, signed_payload(root), signature)
+
+
+def verify_batch(roots):
+    """Пакетная проверка: документы группируются по отправителю, ключ берётся один раз на группу."""
+    if not settings.SIGNATURE_VERIFICATION:
+        return [[] for _ in roots]
+
+    groups = {}
+    for index, root in enumerate(roots):
+        groups.setdefault(root.findtext(".//Sender/SenderINN"), []).append(index)
+
+    futures = [None] * len(roots)
+    for inn, indexes in groups.items():
+        key = get_public_key(inn) if inn else None
+        for index in indexes:
+            signature = roots[index].findtext("SignedData/Signature")
+            if not signature:
+                futures[index] = _done([])
+            elif key is None:
+                futures[index] = _done(_missing_key_errors(inn))
+            else:
+                futures[index] = get_executor().submit(verify, key, signed_payload(roots[index]), signature)
+    return [future.result() for future in futures]
@@ -6,35 +6,77 @@ import pytz
 from lxml import etree
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db import InterfaceError, OperationalError, transaction
 from validate.models import MessageVersion, DocumentFields, Message, Operation, Members, Sender, MessageXML, Error, Rule, Requirement
-from storages.backends.s3boto3 import S3Boto3Storage
-import boto3
-from botocore.exceptions import ClientError
+from .signature import submit_verification
 
 BASE_DIR = settings.BASE_DIR
-storage = S3Boto3Storage()
 
-s3_client = boto3.client(
-    's3',
-    endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-)
+# Клиенты S3 создаются лениво и отдельно в каждом процессе: после fork boto3-клиент родителя использовать нельзя
+_clients = {}
+_checked_buckets = set()
+
+def _process_clients():
+    pid = os.getpid()
+    if _clients.get("pid") != pid:
+        _clients.clear()
+        _checked_buckets.clear()
+        _clients["pid"] = pid
+    return _clients
+
+def get_storage():
+    clients = _process_clients()
+    if "storage" not in clients:
+        from storages.backends.s3boto3 import S3Boto3Storage
+        clients["storage"] = S3Boto3Storage()
+    return clients["storage"]
+
+def get_s3_client():
+    clients = _process_clients()
+    if "s3" not in clients:
+        import boto3
+        clients["s3"] = boto3.client(
+            's3',
+            endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+        )
+    return clients["s3"]
 
 def ensure_bucket_exists(bucket_name):
+    from botocore.exceptions import ClientError
+    s3_client = get_s3_client()
+    if bucket_name in _checked_buckets:
+        return
     try:
         s3_client.head_bucket(Bucket=bucket_name)
+        _checked_buckets.add(bucket_name)
     except ClientError as e:
         if e.response['Error']['Code'] == '404':
             print(f"Бакет {bucket_name} не существует, создаём...")
             try:
                 s3_client.create_bucket(Bucket=bucket_name)
+                _checked_buckets.add(bucket_name)
                 print(f"Бакет {bucket_name} успешно создан.")
             except ClientError as create_error:
                 print(f"Ошибка при создании бакета: {create_error}")
         else:
             print(f"Ошибка при проверке бакета: {e}")
 
+class TransientError(Exception):
+    """Временный сбой инфраструктуры (Postgres, MinIO): документ нужно обработать повторно, а не отклонять."""
+
+def is_transient(error):
+    from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+    # ReadTimeoutError и ConnectionClosedError наследуют HTTPClientError, а не ConnectionError
+    transient = (OperationalError, InterfaceError, BotoConnectionError, HTTPClientError, ConnectionError, TimeoutError)
+    if isinstance(error, transient):
+        return True
+    if isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return status >= 500 or error.response.get("Error", {}).get("Code") in ("SlowDown", "RequestTimeout")
+    return False
+
 class Validator:
     @staticmethod
     def check_date_format(value):
@@ -50,15 +92,28 @@ class Validator:
 
 def save_error_to_db(message, errors):
     try:
-        for error in errors:
-            Error.objects.create(
-                message=message,
-                error_code=error["error_code"],
-                error_message=error["error_message"]
-            )
+        with transaction.atomic():
+            for error in errors:
+                Error.objects.create(
+                    message=message,
+                    error_code=error["error_code"],
+                    error_message=error["error_message"]
+                )
     except Exception as e:
+        if is_transient(e):
+            raise TransientError(f"Failed to save errors: {str(e)}") from e
         print(f"Ошибка при сохранении ошибок в БД: {e}")
 
+def save_related(errors, error_code, label, create):
+    """Запись связанной строки в своей точке сохранения: ошибка данных не ломает общую транзакцию."""
+    try:
+        with transaction.atomic():
+            create()
+    except Exception as e:
+        if is_transient(e):
+            raise TransientError(f"Failed to save {label}: {str(e)}") from e
+        errors.append({"error_code": error_code, "error_message": f"Failed to save {label}: {str(e)}"})
+
 def create_notification_file(document_id, status, errors=None, timestamp=None, version="1.0"):
     out_dir = os.path.join(BASE_DIR, "out")
     try:
@@ -93,13 +148,113 @@ def create_notification_file(document_id, status, errors=None, timestamp=None, v
         minio_path = f"notifications/{file_name}"
         ensure_bucket_exists(settings.AWS_STORAGE_BUCKET_NAME)
         with open(file_path, 'rb') as f:
-            storage.save(minio_path, f)
+            get_storage().save(minio_path, f)
         print(f"Файл {file_name} сохранен в MinIO по пути {minio_path}")
         return file_path
     except Exception as e:
+        if is_transient(e):
+            raise TransientError(f"Failed to create notification: {str(e)}") from e
         print(f"Ошибка при создании уведомления: {e}")
         return None
 
+def load_rules(message_version):
+    return list(
+        Rule.objects.filter(version=message_version, is_active=True)
+        .select_related("document_field")
+        .prefetch_related("requirement_set")
+    )
+
+def check_rules(root, rules):
+    errors = []
+    for rule in rules:
+        try:
+            requirements = rule.requirement_set.all()
+            field_value = root.findtext(rule.document_field.xpath)
+
+            for req in requirements:
+                if req.predicate:
+                    predicate_parts = req.predicate.split(" = ")
+                    if len(predicate_parts) == 2:
+                        predicate_field, predicate_value = predicate_parts
+                        actual_value = root.findtext(predicate_field)
+                        if actual_value == predicate_value.strip("'"):
+                            if req.is_required and not field_value:
+                                errors.append({
+                                    "error_code": "E008",
+                                    "error_message": req.error_template.format(DocumentField=rule.document_field.field)
+                                })
+
+            if rule.document_field.field == "TimeStamp" and field_value and not Validator.check_date_format(field_value):
+                errors.append({"error_code": "E004", "error_message": "Invalid timestamp format"})
+            elif rule.document_field.field == "Amount" and field_value and not Validator.check_amount_format(field_value):
+                errors.append({"error_code": "E005", "error_message": "Invalid amount format"})
+        except Exception as e:
+            errors.append({"error_code": "E015", "error_message": f"Error in rule validation: {str(e)}"})
+    return errors
+
+def get_message_version(version_code):
+    try:
+        return MessageVersion.objects.get(version_code=version_code)
+    except MessageVersion.DoesNotExist:
+        return None
+
+def check_header(root, get_version=get_message_version):
+    """Проверки заголовка документа, общие для приёма и повторной проверки.
+
+    Возвращает (errors, message_version); get_version ищет MessageVersion по коду или возвращает None.
+    """
+    errors = []
+    timestamp_str = root.findtext("TimeStamp")
+    if not timestamp_str:
+        errors.append({"error_code": "E003", "error_message": "Missing TimeStamp"})
+    elif not Validator.check_date_format(timestamp_str):
+        errors.append({"error_code": "E004", "error_message": "Invalid TimeStamp format"})
+
+    if not root.findtext("SignedData/Signature"):
+        errors.append({"error_code": "E005", "error_message": "Missing Signature in SignedData"})
+
+    if root.tag != "ExportData":
+        errors.append({"error_code": "E002", "error_message": "Root tag must be ExportData"})
+
+    # Проверка версии
+    version = root.findtext("Version")
+    message_version = None
+    if not version:
+        errors.append({"error_code": "E017", "error_message": "Missing Version tag"})
+    else:
+        message_version = get_version(version)
+        if message_version is None:
+            errors = [{"error_code": "E001", "error_message": f"Unsupported version: {version}"}]
+    return errors, message_version
+
+def check_amount_currency(root):
+    amount = root.findtext(".//Operation/Amount")
+    currency = root.findtext(".//Operation/Currency")
+    if amount and not currency:
+        return [{"error_code": "E006", "error_message": "Currency is required when Amount is present"}]
+    return []
+
+def revalidate_xml(root, rules_cache):
+    """Повторная проверка сохранённого XML по текущим правилам, без записи в БД и MinIO."""
+    # Версии и правила кэшируются по коду версии на время прогона
+    def get_version(version_code):
+        if version_code not in rules_cache:
+            message_version = get_message_version(version_code)
+            rules = load_rules(message_version) if message_version is not None else None
+            rules_cache[version_code] = (message_version, rules)
+        return rules_cache[version_code][0]
+
+    errors, message_version = check_header(root, get_version)
+    if errors:
+        return {"status": "failed", "errors": errors}
+
+    errors.extend(check_rules(root, rules_cache[message_version.version_code][1]))
+    errors.extend(check_amount_currency(root))
+
+    if errors:
+        return {"status": "failed", "errors": errors}
+    return {"status": "success", "errors": []}
+
 def validate_xml(file_path):
     try:
         # Парсинг XML
@@ -119,157 +274,123 @@ def validate_xml(file_path):
         except ValueError:
             return {"status": "failed", "errors": [{"error_code": "E007", "error_message": f"Invalid UUID: {document_id}"}]}
 
-        # Проверка обязательных тегов
-        errors = []
+        # Проверка обязательных тегов и версии
+        errors, message_version = check_header(root)
         timestamp_str = root.findtext("TimeStamp")
-        if not timestamp_str:
-            errors.append({"error_code": "E003", "error_message": "Missing TimeStamp"})
-        elif not Validator.check_date_format(timestamp_str):
-            errors.append({"error_code": "E004", "error_message": "Invalid TimeStamp format"})
-        else:
-            timestamp = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=pytz.UTC)
-
         signature = root.findtext("SignedData/Signature") or ""
-        if not signature:
-            errors.append({"error_code": "E005", "error_message": "Missing Signature in SignedData"})
-
-        if root.tag != "ExportData":
-            errors.append({"error_code": "E002", "error_message": "Root tag must be ExportData"})
-
-        # Проверка версии
         version = root.findtext("Version")
-        message_version = None
-        if not version:
-            errors.append({"error_code": "E017", "error_message": "Missing Version tag"})
-        else:
-            try:
-                message_version = MessageVersion.objects.get(version_code=version)
-            except MessageVersion.DoesNotExist:
-                errors = [{"error_code": "E001", "error_message": f"Unsupported version: {version}"}]
 
         # Создание или обновление Message
+        # Все записи в БД идут одной транзакцией, уведомление выгружается до коммита:
+        # при временном сбое откатывается всё, и повтор задачи не плодит дубликаты строк
         if errors:
             try:
-                message, created = Message.objects.get_or_create(
-                    id=document_id,
-                    defaults={"message_version": None, "timestamp": None, "signature": signature}
-                )
-                save_error_to_db(message, errors)
-                error_file_path = create_notification_file(document_id, "Denied", errors, timestamp_str, version)
+                with transaction.atomic():
+                    message, created = Message.objects.get_or_create(
+                        id=document_id,
+                        defaults={"message_version": None, "timestamp": None, "signature": signature}
+                    )
+                    save_error_to_db(message, errors)
+                    error_file_path = create_notification_file(document_id, "Denied", errors, timestamp_str, version)
                 return {"status": "failed", "errors": errors, "error_file": error_file_path}
+            except TransientError:
+                raise
             except Exception as e:
+                if is_transient(e):
+                    raise TransientError(f"Failed to save message: {str(e)}") from e
                 return {"status": "failed", "errors": [{"error_code": "E010", "error_message": f"Failed to save message: {str(e)}"}]}
 
-        try:
-            message, created = Message.objects.get_or_create(
-                id=document_id,
-                defaults={"message_version": message_version, "timestamp": timestamp, "signature": signature}
-            )
-            if not created:
-                message.message_version = message_version
-                message.timestamp = timestamp
-                message.signature = signature
-                message.save()
-        except ValidationError as e:
-            return {"status": "failed", "errors": [{"error_code": "E011", "error_message": f"Invalid data for Message: {str(e)}"}]}
-
-        # Обработка Operation
-        operation_node = root.find(".//Operation")
-        if operation_node is not None:
-            try:
-                Operation.objects.create(
-                    message=message,
-                    transaction_date=operation_node.findtext("TransactionDate"),
-                    amount=operation_node.findtext("Amount"),
-                    currency=operation_node.findtext("Currency"),
-                    operation_type=operation_node.findtext("OperationType")
-                )
-            except Exception as e:
-                errors.append({"error_code": "E012", "error_message": f"Failed to save Operation: {str(e)}"})
-
-        # Обработка Members (все участники)
-        members_nodes = root.findall(".//Member")
-        if members_nodes:
-            for member_node in members_nodes:
-                try:
-                    Members.objects.create(
-                        message=message,
-                        member_name=member_node.findtext("MemberName"),
-                        # Предполагается, что в модели Members есть поля member_id и member_role
-                        # Если их нет, нужно обновить модель
-                    )
-                except Exception as e:
-                    errors.append({"error_code": "E013", "error_message": f"Failed to save Members: {str(e)}"})
+        # Заголовок прошёл проверку, значит формат TimeStamp корректен
+        timestamp = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=pytz.UTC)
 
-        # Обработка Sender
-        sender_node = root.find(".//Sender")
-        if sender_node is not None:
-            try:
-                Sender.objects.create(
-                    name=sender_node.findtext("SenderName"),
-                    inn=sender_node.findtext("SenderINN")
-                    # Предполагается, что в модели Sender есть поле sender_id
-                    # Если его нет, нужно обновить модель
-                )
-            except Exception as e:
-                errors.append({"error_code": "E014", "error_message": f"Failed to save Sender: {str(e)}"})
+        # Подпись проверяется в пуле, пока идёт проверка правил и запись в БД и MinIO
+        signature_check = submit_verification(root)
 
         # Проверка правил валидации
-        rules = Rule.objects.filter(version=message_version, is_active=True)
-        for rule in rules:
-            try:
-                requirements = Requirement.objects.filter(rule=rule)
-                field_value = root.findtext(rule.document_field.xpath)
-
-                for req in requirements:
-                    if req.predicate:
-                        predicate_parts = req.predicate.split(" = ")
-                        if len(predicate_parts) == 2:
-                            predicate_field, predicate_value = predicate_parts
-                            actual_value = root.findtext(predicate_field)
-                            if actual_value == predicate_value.strip("'"):
-                                if req.is_required and not field_value:
-                                    errors.append({
-                                        "error_code": "E008",
-                                        "error_message": req.error_template.format(DocumentField=rule.document_field.field)
-                                    })
-
-                if rule.document_field.field == "TimeStamp" and field_value and not Validator.check_date_format(field_value):
-                    errors.append({"error_code": "E004", "error_message": "Invalid timestamp format"})
-                elif rule.document_field.field == "Amount" and field_value and not Validator.check_amount_format(field_value):
-                    errors.append({"error_code": "E005", "error_message": "Invalid amount format"})
-            except Exception as e:
-                errors.append({"error_code": "E015", "error_message": f"Error in rule validation: {str(e)}"})
+        errors.extend(check_rules(root, load_rules(message_version)))
 
         # Проверка Amount и Currency
-        amount = root.findtext(".//Operation/Amount")
-        currency = root.findtext(".//Operation/Currency")
-        if amount and not currency:
-            errors.append({"error_code": "E006", "error_message": "Currency is required when Amount is present"})
+        errors.extend(check_amount_currency(root))
 
-        # Сохранение XML в MinIO
+        # Сохранение XML в MinIO до записи в БД: ключ постоянный, повторная выгрузка его перезаписывает
+        xml_content = etree.tostring(root, encoding="utf-8").decode("utf-8")
+        minio_xml_path = f"original/{document_id}.xml"
+        xml_url_link = None
         try:
-            xml_content = etree.tostring(root, encoding="utf-8").decode("utf-8")
-            minio_xml_path = f"original/{document_id}.xml"
             ensure_bucket_exists(settings.AWS_STORAGE_BUCKET_NAME)
             with open(file_path, 'rb') as f:
-                storage.save(minio_xml_path, f)
-            MessageXML.objects.create(
-                message=message,
-                xml_content=xml_content,
-                xml_url_link=storage.url(minio_xml_path)
-            )
+                get_storage().save(minio_xml_path, f)
+            xml_url_link = get_storage().url(minio_xml_path)
             print(f"Исходный XML сохранен в MinIO по пути {minio_xml_path}")
         except Exception as e:
+            if is_transient(e):
+                raise TransientError(f"Failed to save XML to MinIO: {str(e)}") from e
             errors.append({"error_code": "E016", "error_message": f"Failed to save XML to MinIO: {str(e)}"})
 
-        if errors:
-            save_error_to_db(message, errors)
-            error_file_path = create_notification_file(document_id, "Denied", errors, timestamp_str, version)
-            return {"status": "failed", "errors": errors, "error_file": error_file_path}
+        errors.extend(signature_check.result())
+        # Итог проверки документа без ошибок записи (E012–E014): его же даёт revalidate_xml,
+        # по нему revalidate_messages сравнивает статусы. При E016 MessageXML не создаётся
+        validation_status = "failed" if errors else "success"
+
+        with transaction.atomic():
+            try:
+                message, created = Message.objects.get_or_create(
+                    id=document_id,
+                    defaults={"message_version": message_version, "timestamp": timestamp, "signature": signature}
+                )
+                if not created:
+                    message.message_version = message_version
+                    message.timestamp = timestamp
+                    message.signature = signature
+                    message.save()
+            except ValidationError as e:
+                return {"status": "failed", "errors": [{"error_code": "E011", "error_message": f"Invalid data for Message: {str(e)}"}]}
+
+            # Обработка Operation
+            operation_node = root.find(".//Operation")
+            if operation_node is not None:
+                save_related(errors, "E012", "Operation", lambda: Operation.objects.create(
+                    message=message,
+                    transaction_date=operation_node.findtext("TransactionDate"),
+                    amount=operation_node.findtext("Amount"),
+                    currency=operation_node.findtext("Currency"),
+                    operation_type=operation_node.findtext("OperationType")
+                ))
+
+            # Обработка Members (все участники)
+            for member_node in root.findall(".//Member"):
+                save_related(errors, "E013", "Members", lambda: Members.objects.create(
+                    message=message,
+                    member_name=member_node.findtext("MemberName"),
+                ))
+
+            # Обработка Sender
+            sender_node = root.find(".//Sender")
+            if sender_node is not None:
+                save_related(errors, "E014", "Sender", lambda: Sender.objects.create(
+                    name=sender_node.findtext("SenderName"),
+                    inn=sender_node.findtext("SenderINN")
+                ))
+
+            if xml_url_link is not None:
+                MessageXML.objects.create(
+                    message=message,
+                    xml_content=xml_content,
+                    xml_url_link=xml_url_link,
+                    status=validation_status
+                )
+
+            if errors:
+                save_error_to_db(message, errors)
+                error_file_path = create_notification_file(document_id, "Denied", errors, timestamp_str, version)
+                return {"status": "failed", "errors": errors, "error_file": error_file_path}
 
-        success_file_path = create_notification_file(document_id, "Accepting", timestamp=timestamp_str, version=version)
-        return {"status": "success", "file": success_file_path}
+            success_file_path = create_notification_file(document_id, "Accepting", timestamp=timestamp_str, version=version)
+            return {"status": "success", "file": success_file_path}
 
+    except TransientError:
+        raise
     except Exception as e:
+        if is_transient(e):
+            raise TransientError(f"Unexpected error: {str(e)}") from e
         return {"status": "failed", "errors": [{"error_code": "E999", "error_message": f"Unexpected error: {str(e)}"}]}
\ No newline at end of file
@@ -1,8 +1,17 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
+
+from watch.startup import format_age
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'valxml.settings')
 
 app = Celery('valxml')
 app.config_from_object('django.conf:settings', namespace='CELERY')
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+
+@worker_process_init.connect
+def report_child_startup(**kwargs):
+    # Время от fork дочернего процесса до готовности принимать задачи
+    print(f"Worker child {os.getpid()} ready in {format_age()}")
@@ -100,4 +100,18 @@ CELERY_RESULT_BACKEND = f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/1"
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_TIMEZONE = 'UTC'
\ No newline at end of file
+CELERY_TIMEZONE = 'UTC'
+
+# Signature verification
+SIGNATURE_VERIFICATION = os.getenv('SIGNATURE_VERIFICATION', 'False') == 'True'
+SIGNATURE_KEY_CACHE_TTL = int(os.getenv('SIGNATURE_KEY_CACHE_TTL', '300'))
+SIGNATURE_WORKERS = int(os.getenv('SIGNATURE_WORKERS', '4'))
+
+# Retry / quarantine
+XML_RETRY_MAX_RETRIES = int(os.getenv('XML_RETRY_MAX_RETRIES', '5'))
+XML_RETRY_BACKOFF = int(os.getenv('XML_RETRY_BACKOFF', '2'))
+XML_RETRY_BACKOFF_MAX = int(os.getenv('XML_RETRY_BACKOFF_MAX', '300'))
+QUARANTINE_DIR = os.getenv('QUARANTINE_DIR', os.path.join(BASE_DIR, 'quarantine'))
+CELERY_TASK_ROUTES = {
+    'validate.tasks.dead_letter_xml_file': {'queue': 'dead_letter'},
+}
@@ -1,15 +1,73 @@
 import os
 import time
-import django
-
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'valxml.settings')
-django.setup()
+import uuid
 
+from kombu import Connection, Exchange, Queue
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from validate.tasks import process_xml_file
+
+from watch.startup import format_age
+
+# Вотчер не поднимает Django: задача отправляется в брокер по имени,
+# в формате протокола Celery v2, который понимает воркер из valxml.Celery
+TASK_NAME = "validate.tasks.process_xml_file"
+BROKER_URL = os.getenv(
+    "CELERY_BROKER_URL",
+    f"redis://:{os.getenv('REDIS_PASSWORD', 'redis_password')}@{os.getenv('REDIS_HOST', 'redis')}:{os.getenv('REDIS_PORT', '6379')}/0",
+)
+
+
+def make_queue(name):
+    # Так же Celery объявляет очередь, переданную воркеру через -Q
+    return Queue(name, Exchange(name, type="direct"), routing_key=name)
+
+
+task_queue = make_queue("celery")
+
+
+class TaskSender:
+    def __init__(self, broker_url=BROKER_URL, queue=None):
+        self.connection = Connection(broker_url)
+        self.producer = self.connection.Producer(serializer="json")
+        self.queue = queue or task_queue
+
+    def send(self, task_name, args):
+        task_id = str(uuid.uuid4())
+        self.producer.publish(
+            [list(args), {}, {"callbacks": None, "errbacks": None, "chain": None, "chord": None}],
+            exchange=self.queue.exchange,
+            routing_key=self.queue.routing_key,
+            declare=[self.queue],
+            retry=True,
+            headers={
+                "lang": "py",
+                "task": task_name,
+                "id": task_id,
+                "root_id": task_id,
+                "parent_id": None,
+                "group": None,
+                "retries": 0,
+                "eta": None,
+                "expires": None,
+                "timelimit": [None, None],
+                "argsrepr": repr(tuple(args)),
+                "kwargsrepr": "{}",
+                "origin": f"watcher@{os.uname().nodename}",
+                "ignore_result": True,
+            },
+            correlation_id=task_id,
+        )
+        return task_id
+
+    def close(self):
+        self.connection.release()
+
 
 class WatcherHandler(FileSystemEventHandler):
+    def __init__(self, sender=None):
+        super().__init__()
+        self.sender = sender or TaskSender()
+
     def on_created(self, event):
         if event.is_directory:
             return
@@ -21,7 +79,7 @@ class WatcherHandler(FileSystemEventHandler):
             print(f"Full path: {file_path}")
             if os.path.exists(file_path):
                 print(f"File exists: {file_path}")
-                process_xml_file.delay(file_path)
+                self.sender.send(TASK_NAME, [file_path])
                 print(f"Task sent to Celery for processing: {file_path}")
             else:
                 print(f"Error: File does not exist: {file_path}")
@@ -36,7 +94,7 @@ def start_watching():
     observer.schedule(event_handler, path=watch_path, recursive=False)
     observer.start()
 
-    print(f"Started watching directory: {watch_path}")
+    print(f"Started watching directory: {watch_path} (startup {format_age()} since process start)")
     while True:
         try:
             time.sleep(1)
@@ -46,6 +104,7 @@ def start_watching():
             break
 
     observer.join()
+    event_handler.sender.close()
 
 if __name__ == "__main__":
-    start_watching()
\ No newline at end of file
+    start_watching()
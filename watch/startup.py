@@ -0,0 +1,27 @@
+import os
+
+# Время старта процесса без Django и сторонних зависимостей: импортируется и вотчером, и воркером Celery.
+# Импорты модулей по отдельности: python -X importtime -m watch.checker_path 2> importtime.log
+
+
+def process_age():
+    """Секунды с момента запуска процесса (для дочернего процесса воркера — с момента fork).
+
+    Берётся из /proc/self/stat, поэтому включает запуск интерпретатора и все импорты.
+    Вне Linux возвращает None.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # Поле comm в скобках может содержать пробелы, поэтому считаем поля после «)»
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, IndexError, ValueError):
+        return None
+    # starttime — 22-е поле stat, в тиках с момента загрузки системы
+    return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+
+
+def format_age():
+    age = process_age()
+    return "unknown" if age is None else f"{age:.3f}s"